@@ -1,51 +1,23 @@
-import os
-import requests
 import time
 import re
-from openai import OpenAI
 from dotenv import load_dotenv
+from model_router import get_router
 from prompt_builder import build_diagnosis_prompt
 
 load_dotenv(override=True)
 
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-MODEL_BACKEND = os.getenv("MODEL_BACKEND", "mistral")  # or "gpt-4"
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4-1106-preview")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-client = None
-if MODEL_BACKEND == "gpt-4":
-    client = OpenAI(api_key=OPENAI_API_KEY)
+ERROR_CLASS_PATTERN = re.compile(r"\b((?:[A-Z]\w*::)*[A-Z]\w*(?:Error|Exception))\b")
 
 
 # 🔁 Reusable for general-purpose prompting (used by validate_and_correct_ruby_code)
-def ask_model(prompt_text: str) -> str:
-    if MODEL_BACKEND == "gpt-4":
-        print("🤖 Using GPT-4 via OpenAI API")
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a senior Ruby on Rails developer."},
-                {"role": "user", "content": prompt_text},
-            ],
-            temperature=0.2,
-            max_tokens=1024,
-        )
-        return response.choices[0].message.content.strip()
-    else:
-        print(f"🤖 Using {MODEL_BACKEND} via Ollama at {OLLAMA_HOST}")
-        response = requests.post(
-            f"{OLLAMA_HOST}/api/generate",
-            json={
-                "model": MODEL_BACKEND,
-                "prompt": prompt_text,
-                "stream": False,
-                "options": {"temperature": 0.2, "num_predict": 1024},
-            },
-        )
-        if response.status_code != 200:
-            raise RuntimeError(f"Ollama returned {response.status_code}: {response.text}")
-        return response.json()["response"].strip()
+def ask_model(prompt_text: str, error_class: str = None) -> str:
+    return get_router().ask(prompt_text, error_class=error_class)
+
+
+def detect_error_class(message: str) -> str:
+    # Fallback only: Ruby messages rarely name the class ("undefined method `x' for nil:NilClass")
+    match = ERROR_CLASS_PATTERN.search(message or "")
+    return match.group(1) if match else None
 
 
 def extract_ruby_code_block(response: str) -> str:
@@ -70,7 +42,8 @@ def extract_ruby_code_block(response: str) -> str:
     return ""
 
 
-def diagnose_log(message: str, stack_trace: str = None, code_context: str = None, runtime_info: dict = None):
+def diagnose_log(message: str, stack_trace: str = None, code_context: str = None, runtime_info: dict = None,
+                 error_class: str = None):
     def trim(text: str, max_lines: int = 20) -> str:
         lines = text.splitlines()
         filtered = [
@@ -80,6 +53,7 @@ def diagnose_log(message: str, stack_trace: str = None, code_context: str = None
         result = filtered if filtered else lines[:max_lines]
         return "\n".join(result[:max_lines])
 
+    error_class = error_class or detect_error_class(message)
     trimmed_message = trim(message, 10)
     trimmed_stack = trim(stack_trace or "", 20)
 
@@ -94,7 +68,7 @@ def diagnose_log(message: str, stack_trace: str = None, code_context: str = None
     print(initial_prompt)
 
     start = time.time()
-    initial_response = ask_model(initial_prompt)
+    initial_response = ask_model(initial_prompt, error_class=error_class)
     elapsed = time.time() - start
     print(f"⏱️ AI responded in {elapsed:.2f} seconds.")
     print("🧠 Full AI response from prompt:\n")
@@ -119,5 +93,5 @@ Please verify and improve it if necessary. Return just the fixed Ruby code.
 ❌ Do not include fences
 """.strip()
 
-    reviewed_code = ask_model(review_prompt)
+    reviewed_code = ask_model(review_prompt, error_class=error_class)
     return initial_response, reviewed_code.strip()
@@ -0,0 +1,51 @@
+import os
+import time
+import pickle
+import numpy as np
+from embedding_encoder import load_encoder
+
+# Compares the quantized ONNX encoder against the torch one on the indexed codebase
+METADATA_FILE = "codebase_metadata.pkl"
+SAMPLE_SIZE = int(os.getenv("PARITY_SAMPLE_SIZE", "500"))
+QUERY_COUNT = int(os.getenv("PARITY_QUERY_COUNT", "50"))
+TOP_K = int(os.getenv("PARITY_TOP_K", "5"))
+
+
+def timed_encode(encoder, texts: list[str]) -> tuple[np.ndarray, float]:
+    start = time.time()
+    embeddings = np.asarray(encoder.encode(texts, batch_size=64, convert_to_numpy=True), dtype=np.float32)
+    return embeddings, time.time() - start
+
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    # Squared L2 on the same vectors IndexFlatL2 sees
+    distances = ((queries[:, None, :] - corpus[None, :, :]) ** 2).sum(axis=-1)
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+# The metadata file is a stream of pickled chunks; only read as many as the sample needs
+corpus = []
+with open(METADATA_FILE, "rb") as f:
+    while len(corpus) < SAMPLE_SIZE:
+        try:
+            corpus.extend(m["code"] for m in pickle.load(f))
+        except EOFError:
+            break
+corpus = corpus[:SAMPLE_SIZE]
+# Method-sized queries: the first few lines of sampled files
+queries = ["\n".join(code.splitlines()[:8]) for code in corpus[:QUERY_COUNT]]
+print(f"🔍 Comparing encoders on {len(corpus)} files and {len(queries)} queries (top {TOP_K})...")
+
+results = {}
+for backend in ("torch", "onnx"):
+    encoder = load_encoder(backend)
+    corpus_vectors, corpus_seconds = timed_encode(encoder, corpus)
+    query_vectors, _ = timed_encode(encoder, queries)
+    results[backend] = top_k(corpus_vectors, query_vectors, TOP_K)
+    print(f"⏱️ {backend}: {len(corpus) / corpus_seconds:.1f} files/sec")
+
+overlaps = [
+    len(set(torch_hits) & set(onnx_hits)) / TOP_K
+    for torch_hits, onnx_hits in zip(results["torch"], results["onnx"])
+]
+print(f"✅ Mean top-{TOP_K} overlap: {np.mean(overlaps):.1%} (min {np.min(overlaps):.1%})")
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import threading
+import traceback
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from fetch_trace_errors import GITHUB_TOKEN, REPO_NAME, fetch_span_page, enqueue_span, run_job, submit_ready
+from github_client import get_repo
+from job_queue import JobQueue
+from model_router import get_router
+from search_similar_code import get_model_and_cache, load_index_and_metadata
+
+load_dotenv()
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "300"))  # seconds, 0 = only accept pushed spans
+INITIAL_WINDOW = os.getenv("INITIAL_POLL_WINDOW", "now-24h")
+POLL_LIMIT = int(os.getenv("POLL_LIMIT", "50"))  # spans per page
+POLL_MAX_PAGES = int(os.getenv("POLL_MAX_PAGES", "20"))  # per poll; the rest is picked up next poll
+POLL_OVERLAP_MS = 60_000  # re-read the last minute to catch late-indexed spans; the queue deduplicates
+
+
+class DiagnoserService:
+    """
+    Long-running mode: keeps the model, index, router and repo handle loaded,
+    polls Datadog and/or accepts pushed spans, and runs each new error through the job queue.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.jobs = JobQueue()
+        self.worker = f"{os.uname().nodename}:{os.getpid()}:service"
+        self.outcomes = Counter()
+        self.received = 0
+        self.duplicates = 0
+        self.submitted = 0
+        self.processing_seconds = 0.0
+        self.last_poll = None
+        self.last_poll_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        print("🔄 Warming up model, index, router and GitHub repo...")
+        self.repo = get_repo(GITHUB_TOKEN, REPO_NAME)
+        get_model_and_cache()
+        try:
+            load_index_and_metadata()
+        except FileNotFoundError as e:
+            print(e)
+        get_router()
+
+    def submit(self, span: dict) -> bool:
+        queued = enqueue_span(self.jobs, span)
+        with self._lock:
+            self.received += 1
+            if not queued:
+                self.duplicates += 1
+        return queued
+
+    def poll_once(self, from_time: str, to_time: str = None, cursor: str = None) -> tuple:
+        """Queue up to POLL_MAX_PAGES pages of spans. Returns the (from_time, to_time, cursor) to poll next."""
+        if cursor is None:
+            # Datadog accepts epoch milliseconds; pin the window so cursors stay valid
+            to_time = str(int(time.time() * 1000))
+        fetched = queued = pages = 0
+        while True:
+            spans, cursor = fetch_span_page(from_time, to_time, POLL_LIMIT, cursor)
+            fetched += len(spans)
+            queued += sum(self.submit(span) for span in spans)
+            pages += 1
+            if cursor is None or pages >= POLL_MAX_PAGES:
+                break
+        print(f"✅ Polled {fetched} span(s) over {pages} page(s), {queued} new.")
+
+        if cursor is None:
+            from_time = str(int(to_time) - POLL_OVERLAP_MS)
+        else:
+            print(f"⚠️ More than {POLL_MAX_PAGES} pages of errors — continuing from the cursor next poll.")
+        return from_time, to_time, cursor
+
+    def poll_forever(self):
+        window = (INITIAL_WINDOW, None, None)
+        while not self._stop.is_set():
+            try:
+                # A failed poll keeps the previous window; the queue drops re-read spans
+                window = self.poll_once(*window)
+                self.last_poll_error = None
+            except Exception as e:
+                print(f"❌ Poll failed: {e}")
+                self.last_poll_error = str(e)
+            self.last_poll = time.time()
+            self._stop.wait(POLL_INTERVAL)
+
+    def work_forever(self):
+        while not self._stop.is_set():
+            job = self.jobs.claim(self.worker, ["fetched"])
+            if job is None:
+                # Nothing left to diagnose: open PRs for what is ready, grouped by file
+                submitted = submit_ready(self.jobs, self.repo, self.worker)
+                if submitted:
+                    with self._lock:
+                        self.submitted += submitted
+                else:
+                    self._stop.wait(1)
+                continue
+            start = time.time()
+            try:
+                outcome = run_job(self.jobs, job, self.repo)
+            except Exception as e:
+                print(f"❌ Job {job['fingerprint']} failed at attempt {job['attempts']}: {e}")
+                traceback.print_exc()
+                self.jobs.fail(job["fingerprint"], str(e))
+                outcome = "error"
+            elapsed = time.time() - start
+            with self._lock:
+                self.outcomes[outcome] += 1
+                self.processing_seconds += elapsed
+            print(f"⏱️ Span processed in {elapsed:.2f}s ({outcome})")
+            print("-" * 60)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            processed = sum(self.outcomes.values())
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "spans_received": self.received,
+                "duplicates_skipped": self.duplicates,
+                "jobs": self.jobs.stats(),
+                "processed": processed,
+                "outcomes": dict(self.outcomes),
+                "submitted_to_github": self.submitted,
+                "avg_processing_seconds": round(self.processing_seconds / processed, 2) if processed else None,
+                "last_poll": self.last_poll,
+                "last_poll_error": self.last_poll_error,
+                "backends": {
+                    name: {"healthy": b.healthy, "in_flight": b.in_flight, "max_in_flight": b.max_in_flight}
+                    for name, b in get_router().backends.items()
+                },
+            }
+
+    def stop(self):
+        self._stop.set()
+
+
+def make_handler(service: DiagnoserService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send_json(200, service.metrics())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/spans":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError):
+                self._send_json(400, {"error": "invalid JSON"})
+                return
+
+            # Accept a Datadog search response, a list of spans, or a single span
+            spans = payload.get("data", []) if isinstance(payload, dict) and "data" in payload else payload
+            if isinstance(spans, dict):
+                spans = [spans]
+            if not isinstance(spans, list):
+                self._send_json(400, {"error": "expected a span, a list of spans or a span search response"})
+                return
+            queued = sum(service.submit(span) for span in spans if isinstance(span, dict))
+            self._send_json(202, {"queued": queued})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    service = DiagnoserService()
+
+    threading.Thread(target=service.work_forever, daemon=True).start()
+    if POLL_INTERVAL > 0:
+        threading.Thread(target=service.poll_forever, daemon=True).start()
+
+    server = ThreadingHTTPServer((SERVICE_HOST, SERVICE_PORT), make_handler(service))
+    print(f"🚀 Diagnoser service listening on http://{SERVICE_HOST}:{SERVICE_PORT} (poll every {POLL_INTERVAL}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("👋 Shutting down.")
+    finally:
+        service.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,31 @@
 import os
+import time
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
 import faiss
 import pickle
 import numpy as np
+from embedding_cache import EmbeddingCache, encode_with_cache
+from embedding_encoder import EMBEDDING_BACKEND, load_encoder, encoder_cache_name
 
 # Config
 CODE_DIR = "app"  # Path to root of your codebase
-MODEL_NAME = "all-MiniLM-L6-v2"
 INDEX_FILE = "codebase.index"
 METADATA_FILE = "codebase_metadata.pkl"
+BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+WORKERS = int(os.getenv("EMBED_WORKERS", str(os.cpu_count() or 1)))
+CHUNK_FILES = int(os.getenv("EMBED_CHUNK_FILES", "512"))  # files read into memory at once
 
-# Load embedding model
-print("🔄 Loading embedding model...")
-model = SentenceTransformer(MODEL_NAME)
 
-# Gather Ruby files
-print(f"🔍 Indexing Ruby files in {CODE_DIR}/...")
-paths = list(Path(CODE_DIR).rglob("*.rb"))
-
-texts = []
-metadatas = []
-
-for path in paths:
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            content = f.read()
+def iter_file_chunks(paths: list[Path], chunk_size: int):
+    """Yield (texts, metadatas) chunks, reading files lazily."""
+    texts, metadatas = [], []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except Exception as e:
+            print(f"⚠️ Skipped {path}: {e}")
+            continue
         if not content.strip():
             continue
         texts.append(content)
@@ -33,23 +33,103 @@ for path in paths:
             "path": str(path),
             "code": content.strip()
         })
-    except Exception as e:
-        print(f"⚠️ Skipped {path}: {e}")
+        if len(texts) >= chunk_size:
+            yield texts, metadatas
+            texts, metadatas = [], []
+    if texts:
+        yield texts, metadatas
+
+
+def file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def start_encoder_pool(model, workers: int):
+    # Each worker is a separate torch process; with torch's default of one thread per core
+    # in every worker, N workers would run N x cores threads. Spawned workers read this at import.
+    previous = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = "1"
+    try:
+        return model.start_multi_process_pool(target_devices=["cpu"] * workers)
+    finally:
+        if previous is None:
+            os.environ.pop("OMP_NUM_THREADS", None)
+        else:
+            os.environ["OMP_NUM_THREADS"] = previous
+
+
+class LazyEncoderPool:
+    """Starts the worker pool the first time a chunk has enough uncached files to need it."""
+
+    def __init__(self, model, workers: int):
+        self.model = model
+        self.workers = workers
+        self.pool = None
+
+    def __call__(self):
+        if self.pool is None:
+            print(f"🧵 Starting {self.workers} encoder processes (batch size {BATCH_SIZE})...")
+            self.pool = start_encoder_pool(self.model, self.workers)
+        return self.pool
+
+    def stop(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+def main():
+    # Load embedding model
+    print(f"🔄 Loading embedding model ({EMBEDDING_BACKEND} backend)...")
+    model = load_encoder()
+    cache_name = encoder_cache_name()
+    dimension = model.get_sentence_embedding_dimension()
+    cache = EmbeddingCache(dimension)
+
+    # Gather Ruby files, shortest first so each batch pads to a similar length
+    print(f"🔍 Indexing Ruby files in {CODE_DIR}/...")
+    paths = sorted(Path(CODE_DIR).rglob("*.rb"), key=file_size)
+
+    pool = None
+    # ONNX Runtime already uses every core inside one session; only torch needs a process pool
+    if WORKERS > 1 and hasattr(model, "start_multi_process_pool"):
+        # Not started until needed: a re-index that is all cache hits never pays for it
+        pool = LazyEncoderPool(model, WORKERS)
+
+    index = faiss.IndexFlatL2(dimension)
+    start = time.time()
+    # Metadata is pickled one chunk at a time so file contents never pile up in memory;
+    # the temp file replaces the old one only once the index is written
+    metadata_tmp = f"{METADATA_FILE}.tmp"
+    metadata_file = open(metadata_tmp, "wb")
+
+    try:
+        for texts, metadatas in iter_file_chunks(paths, CHUNK_FILES):
+            embeddings = encode_with_cache(model, texts, cache, cache_name, pool=pool, batch_size=BATCH_SIZE)
+            index.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+            pickle.dump(metadatas, metadata_file)
+
+            elapsed = time.time() - start
+            print(f"🧠 {index.ntotal}/{len(paths)} files embedded ({index.ntotal / elapsed:.1f} files/sec)")
+    finally:
+        metadata_file.close()
+        if pool is not None:
+            pool.stop()
 
-# Generate embeddings
-print(f"🧠 Generating {len(texts)} embeddings...")
-embeddings = model.encode(texts, convert_to_tensor=False)
-embeddings = np.array(embeddings)
+    if index.ntotal == 0:
+        os.remove(metadata_tmp)
+        print("⚠️ No Ruby files found to index.")
+        return
 
-# Save FAISS index
-dimension = embeddings[0].shape[0]
-index = faiss.IndexFlatL2(dimension)
-index.add(embeddings)
+    print(f"💾 Saving index to {INDEX_FILE} and metadata to {METADATA_FILE}...")
+    faiss.write_index(index, INDEX_FILE)
+    os.replace(metadata_tmp, METADATA_FILE)
 
-print(f"💾 Saving index to {INDEX_FILE} and metadata to {METADATA_FILE}...")
-faiss.write_index(index, INDEX_FILE)
+    print(f"✅ Codebase embedding complete in {time.time() - start:.1f}s.")
 
-with open(METADATA_FILE, "wb") as f:
-    pickle.dump(metadatas, f)
 
-print("✅ Codebase embedding complete.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import re
+import math
+import time
+import fcntl
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", "embedding_cache.npy")
+EMBEDDING_CACHE_INDEX_FILE = os.getenv("EMBEDDING_CACHE_INDEX_FILE", "embedding_cache_index.sqlite3")
+EMBEDDING_CACHE_CAPACITY = int(os.getenv("EMBEDDING_CACHE_CAPACITY", "50000"))
+# Fewer uncached texts than this are encoded in-process; queueing them to workers costs more
+POOL_MIN_TEXTS = int(os.getenv("EMBED_POOL_MIN_TEXTS", "128"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (dimension INTEGER NOT NULL, capacity INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    slot INTEGER NOT NULL UNIQUE,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+
+def normalize_text(text: str) -> str:
+    # MiniLM is uncased and ignores whitespace runs, so this never changes the vector
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def text_key(text: str, model_name: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Fixed-capacity vector cache shared by embed_codebase.py, search_similar_code.py
+    and every worker process on the host. Vectors live in a memory-mapped float32 .npy
+    file; the key -> slot map and LRU order live in SQLite. An flock on the index file
+    guards the pair: shared for reads, exclusive for slot allocation and writes.
+    """
+
+    def __init__(self, dimension: int, path: str = EMBEDDING_CACHE_FILE,
+                 index_path: str = EMBEDDING_CACHE_INDEX_FILE, capacity: int = EMBEDDING_CACHE_CAPACITY):
+        self.dimension = dimension
+        self.path = path
+        self.index_path = index_path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._hits = {}  # key -> last use, flushed by save() instead of on every hit
+
+        self._conn = sqlite3.connect(index_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock_file = open(f"{index_path}.lock", "a")
+
+        with self._file_lock(fcntl.LOCK_EX):
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            meta = self._conn.execute("SELECT dimension, capacity FROM meta").fetchone()
+            if meta == (dimension, capacity) and os.path.exists(path):
+                self.vectors = np.load(path, mmap_mode="r+")
+            else:
+                if meta is not None:
+                    print(f"⚠️ Embedding cache shape {meta} does not match — rebuilding.")
+                self.vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                                         shape=(capacity, dimension))
+                self._conn.executescript("DELETE FROM entries; DELETE FROM meta;")
+                self._conn.execute("INSERT INTO meta VALUES (?, ?)", (dimension, capacity))
+
+    @contextmanager
+    def _file_lock(self, mode: int):
+        with self._lock:
+            fcntl.flock(self._lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Return {key: vector} for every key that is cached."""
+        found = {}
+        with self._file_lock(fcntl.LOCK_SH):
+            for key in keys:
+                row = self._conn.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    found[key] = np.array(self.vectors[row[0]])
+            now = time.time()
+            self._hits.update((key, now) for key in found)
+        return found
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: list[tuple[str, np.ndarray]]) -> None:
+        if not items:
+            return
+        with self._file_lock(fcntl.LOCK_EX):
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                used = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                for key, vector in items:
+                    row = conn.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        slot = row[0]
+                        conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                    elif used < self.capacity:
+                        slot = used
+                        used += 1
+                        conn.execute("INSERT INTO entries VALUES (?, ?, ?)", (key, slot, now))
+                    else:
+                        # Evict the least recently used entry and reuse its slot
+                        slot = conn.execute(
+                            "SELECT slot FROM entries ORDER BY last_used LIMIT 1"
+                        ).fetchone()[0]
+                        conn.execute("DELETE FROM entries WHERE slot = ?", (slot,))
+                        conn.execute("INSERT INTO entries VALUES (?, ?, ?)", (key, slot, now))
+                    self.vectors[slot] = np.asarray(vector, dtype=np.float32)
+                self.vectors.flush()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def put(self, key: str, vector) -> None:
+        self.put_many([(key, vector)])
+
+    def save(self) -> None:
+        """Persist LRU recency for recent hits — a handful of row updates, not a rewrite."""
+        with self._lock:
+            hits, self._hits = self._hits, {}
+            if hits:
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = MAX(last_used, ?) WHERE key = ?",
+                    [(used, key) for key, used in hits.items()],
+                )
+
+
+def encode_with_cache(model, texts: list[str], cache: EmbeddingCache, model_name: str,
+                      pool=None, **encode_kwargs) -> np.ndarray:
+    """Encode texts, running the model only on the ones not already cached.
+    Pass a pool from model.start_multi_process_pool(), or a callable that starts one on first
+    use, to spread larger uncached sets over processes."""
+    keys = [text_key(text, model_name) for text in texts]
+    embeddings = np.zeros((len(texts), cache.dimension), dtype=np.float32)
+
+    cached = cache.get_many(keys)
+    missing = []
+    for i, key in enumerate(keys):
+        if key in cached:
+            embeddings[i] = cached[key]
+        else:
+            missing.append(i)
+
+    if missing:
+        uncached = [texts[i] for i in missing]
+        if pool is not None and len(uncached) >= POOL_MIN_TEXTS:
+            if callable(pool):
+                pool = pool()
+            # Left unset, each worker gets a tenth of its share per job, far below batch_size
+            share = math.ceil(len(uncached) / len(pool["processes"]))
+            encode_kwargs.setdefault("chunk_size", max(encode_kwargs.get("batch_size", 32), share))
+            encoded = model.encode_multi_process(uncached, pool, **encode_kwargs)
+        else:
+            encoded = model.encode(uncached, convert_to_numpy=True, **encode_kwargs)
+        for i, vector in zip(missing, encoded):
+            embeddings[i] = vector
+        cache.put_many([(keys[i], embeddings[i]) for i in missing])
+
+    cache.save()
+    return embeddings
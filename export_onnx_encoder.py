@@ -0,0 +1,22 @@
+import os
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from transformers import AutoTokenizer
+from embedding_encoder import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR, ONNX_MODEL_FILE
+
+# One-off export: needs torch + optimum, the exported encoder does not
+HF_MODEL_ID = f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+
+print(f"🔄 Exporting {HF_MODEL_ID} to ONNX...")
+model = ORTModelForFeatureExtraction.from_pretrained(HF_MODEL_ID, export=True)
+model.save_pretrained(ONNX_MODEL_DIR)
+AutoTokenizer.from_pretrained(HF_MODEL_ID).save_pretrained(ONNX_MODEL_DIR)
+
+print("🗜️ Applying int8 dynamic quantization...")
+quantize_dynamic(
+    os.path.join(ONNX_MODEL_DIR, "model.onnx"),
+    os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE),
+    weight_type=QuantType.QInt8,
+)
+
+print(f"✅ Quantized encoder saved to {ONNX_MODEL_DIR}/{ONNX_MODEL_FILE}")
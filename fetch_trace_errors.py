@@ -1,4 +1,5 @@
 import os
+import sys
 import requests
 import json
 import hashlib
@@ -8,7 +9,9 @@ from dotenv import load_dotenv
 from analyze_error import diagnose_log
 from github_code_fetcher import fetch_code_context
 from github_client import get_repo, get_existing_pr, submit_pr_to_github
-from pr_manager import create_pull_request
+from job_queue import JobQueue
+from pr_manager import build_pull_request, submit_pull_request
+from ruby_syntax import check_syntax_batch
 
 load_dotenv()
 
@@ -22,51 +25,48 @@ TARGET_SPAN_ID = os.getenv("TARGET_SPAN_ID")
 if not DATADOG_API_KEY or not DATADOG_APP_KEY or not GITHUB_TOKEN:
     raise RuntimeError("❌ Missing required environment variables.")
 
-repo = get_repo(GITHUB_TOKEN, REPO_NAME)
-
-headers = {
+HEADERS = {
     "DD-API-KEY": DATADOG_API_KEY,
     "DD-APPLICATION-KEY": DATADOG_APP_KEY,
     "Content-Type": "application/json"
 }
+SPAN_QUERY = "env:prod status:error service:patchwork-on-rails -operation_name:rack.request"
+
+def fetch_spans(from_time: str = "now-24h", to_time: str = "now", limit: int = 10) -> list[dict]:
+    spans, _ = fetch_span_page(from_time, to_time, limit)
+    return spans
 
-payload = {
-    "data": {
-        "type": "search_request",
-        "attributes": {
-            "filter": {
-                "from": "now-24h",
-                "to": "now",
-                "query": "env:prod status:error service:patchwork-on-rails -operation_name:rack.request"
-            },
-            "options": {
-                "timezone": "GMT"
-            },
-            "page": {
-                "limit": 10
-            },
-            "sort": "timestamp"
+def fetch_span_page(from_time: str, to_time: str, limit: int, cursor: str = None) -> tuple:
+    """Fetch one page of error spans. Returns (spans, cursor for the next page or None)."""
+    payload = {
+        "data": {
+            "type": "search_request",
+            "attributes": {
+                "filter": {
+                    "from": from_time,
+                    "to": to_time,
+                    "query": SPAN_QUERY
+                },
+                "options": {
+                    "timezone": "GMT"
+                },
+                "page": {
+                    "limit": limit,
+                    **({"cursor": cursor} if cursor else {})
+                },
+                "sort": "timestamp"
+            }
         }
     }
-}
 
-url = f"{DATADOG_SITE}/api/v2/spans/events/search"
-response = requests.post(url, headers=headers, json=payload)
+    url = f"{DATADOG_SITE}/api/v2/spans/events/search"
+    response = requests.post(url, headers=HEADERS, json=payload, timeout=30)
 
-if response.status_code != 200:
-    print("❌ Failed to fetch spans:", response.status_code, response.text)
-    exit(1)
+    if response.status_code != 200:
+        raise RuntimeError(f"❌ Failed to fetch spans: {response.status_code} {response.text}")
 
-spans = response.json().get("data", [])
-print(f"✅ Fetched {len(spans)} span(s).\n")
-
-if TARGET_SPAN_ID:
-    filtered = [s for s in spans if s.get("attributes", {}).get("span_id") == TARGET_SPAN_ID]
-    if filtered:
-        print(f"🔍 Using span with ID: {TARGET_SPAN_ID}")
-        spans = filtered
-    else:
-        print(f"⚠️ No span matched TARGET_SPAN_ID={TARGET_SPAN_ID} — proceeding with all spans.")
+    body = response.json()
+    return body.get("data", []), body.get("meta", {}).get("page", {}).get("after")
 
 VALID_PATH_PREFIXES = ["app/", "lib/", "config/", "db/"]
 INVALID_PATH_PARTS = ["/gems/", "/usr/", "/ruby/", "/vendor/", "<", "(eval)"]
@@ -88,7 +88,8 @@ def generate_error_id(error_info: dict) -> str:
     ]
     return hashlib.md5("::".join(components).encode()).hexdigest()
 
-for span in spans:
+def prepare_span(span: dict, repo) -> tuple:
+    """Collect everything the diagnosis needs. Returns (outcome, context) — context is None when the span is skipped."""
     attr = span.get("attributes", {})
     trace_id = attr.get("trace_id")
     span_id = attr.get("span_id")
@@ -101,74 +102,249 @@ for span in spans:
     print(f"Span ID: {span_id}")
     print(f"Resource: {resource}")
 
-    if error_info:
-        error_id = generate_error_id(error_info)
-        print(f"Issue Fingerprint: {error_id}")
+    if not error_info:
+        print("\n⚠️ No error info in `custom.error`")
+        return "no_error_info", None
 
-        existing_pr = get_existing_pr(repo, error_id)
-        if existing_pr:
-            print(f"⚠️ Skipping — PR already exists: {existing_pr.html_url}")
-            continue
+    error_id = generate_error_id(error_info)
+    print(f"Issue Fingerprint: {error_id}")
 
-        message = error_info.get("message", "")
-        stack = error_info.get("stack", "")
-        code_context = None
-
-        raw_filepath = error_info.get("file", "")
-        filepath = raw_filepath.lstrip("/")
-        while filepath.startswith("app/app/"):
-            filepath = filepath.replace("app/", "", 1)
-
-        line_number = None
-
-        if is_valid_code_path(filepath) and stack:
-            for line in stack.splitlines():
-                if filepath in line:
-                    match = re.search(r"{}:(\d+)".format(re.escape(filepath)), line)
-                    if match:
-                        line_number = int(match.group(1))
-                        code_context = fetch_code_context(filepath, line_number)
-                        break
-        else:
-            print(f"⚠️ Skipping — file path not in allowed directories: {raw_filepath}")
-            continue
+    existing_pr = get_existing_pr(repo, error_id)
+    if existing_pr:
+        print(f"⚠️ Skipping — PR already exists: {existing_pr.html_url}")
+        return "existing_pr", None
 
-        print("\n🧠 Analyzing error with AI...")
+    message = error_info.get("message", "")
+    stack = error_info.get("stack", "")
+    code_context = None
 
-        # ✅ Extract runtime info from span metadata
-        meta_tags = attr.get("meta", {})
-        runtime_info = {
-            k: str(v) for k, v in meta_tags.items()
-            if not k.startswith("http.") and not k.startswith("datadog.")
-        }
+    raw_filepath = error_info.get("file", "")
+    filepath = raw_filepath.lstrip("/")
+    while filepath.startswith("app/app/"):
+        filepath = filepath.replace("app/", "", 1)
+
+    line_number = None
+
+    if is_valid_code_path(filepath) and stack:
+        for line in stack.splitlines():
+            if filepath in line:
+                match = re.search(r"{}:(\d+)".format(re.escape(filepath)), line)
+                if match:
+                    line_number = int(match.group(1))
+                    code_context = fetch_code_context(filepath, line_number, repo=repo)
+                    break
+    else:
+        print(f"⚠️ Skipping — file path not in allowed directories: {raw_filepath}")
+        return "invalid_path", None
+
+    # ✅ Extract runtime info from span metadata
+    meta_tags = attr.get("meta", {})
+    runtime_info = {
+        k: str(v) for k, v in meta_tags.items()
+        if not k.startswith("http.") and not k.startswith("datadog.")
+    }
+
+    return "ready", {
+        "error_id": error_id,
+        "message": message,
+        "error_class": error_info.get("type"),  # e.g. NoMethodError, used for model routing
+        "stack": stack,
+        "filepath": filepath,
+        "line_number": line_number,
+        "code_context": code_context,
+        "runtime_info": runtime_info,
+    }
+
+def diagnose_span(context: dict):
+    """Run the AI diagnosis for a prepared span. Returns the diagnosis and fix, or None if unusable."""
+    print("\n🧠 Analyzing error with AI...")
+
+    runtime_info = context["runtime_info"]
+    if runtime_info:
+        print("\n🧩 Runtime Info extracted from span:")
+        for key, value in runtime_info.items():
+            print(f"{key} = {value}")
+
+    diagnosis_text, final_code_str = diagnose_log(
+        context["message"],
+        stack_trace=context["stack"],
+        code_context=context["code_context"],
+        runtime_info=runtime_info,
+        # Contexts checkpointed before the class was stored fall back to the message
+        error_class=context.get("error_class"),
+    )
+
+    if not diagnosis_text or not final_code_str:
+        print("⚠️ Skipping PR — AI failed to return usable explanation or code.")
+        return None
+
+    print("🧪 Extracted replacement code:\n")
+    print(final_code_str)
+    return {"diagnosis_text": diagnosis_text, "final_code_str": final_code_str}
+
+
+def enqueue_span(jobs: JobQueue, span: dict) -> bool:
+    error_info = span.get("attributes", {}).get("custom", {}).get("error", {})
+    if not error_info:
+        return False
+    return jobs.enqueue(generate_error_id(error_info), span)
+
+def run_job(jobs: JobQueue, job: dict, repo) -> str:
+    """Prepare and diagnose a claimed span, then hand it back for file-grouped submission."""
+    fingerprint = job["fingerprint"]
+
+    outcome, context = prepare_span(job["span"], repo)
+    if context is None:
+        jobs.finish(fingerprint, outcome)
+        return outcome
 
-        if runtime_info:
-            print("\n🧩 Runtime Info extracted from span:")
-            for key, value in runtime_info.items():
-                print(f"{key} = {value}")
+    diagnosis = diagnose_span(context)
+    if diagnosis is None:
+        jobs.finish(fingerprint, "no_fix")
+        return "no_fix"
 
-        diagnosis_text, final_code_str = diagnose_log(
-            message,
-            stack_trace=stack,
-            code_context=code_context,
-            runtime_info=runtime_info
-        )
+    jobs.checkpoint(fingerprint, "diagnosed", {"context": context, **diagnosis})
+    jobs.release(fingerprint)
+    return "diagnosed"
 
-        if not diagnosis_text or not final_code_str:
-            print("⚠️ Skipping PR — AI failed to return usable explanation or code.")
+def submit_ready(jobs: JobQueue, repo, worker: str) -> int:
+    """
+    Open one PR per file for every diagnosed job, so several fixes to the same file
+    share one fetch, one lint and one commit. Returns the number of jobs handled.
+    """
+    ready = jobs.claim_all(worker, ["diagnosed", "linted"])
+    if not ready:
+        return 0
+
+    # Reject syntactically broken fixes in one pass before any RuboCop launch
+    diagnosed = [job for job in ready if job["stage"] == "diagnosed"]
+    verdicts = check_syntax_batch([job["artifacts"]["final_code_str"] for job in diagnosed])
+    rejected = set()
+    for job, (is_valid, reason) in zip(diagnosed, verdicts):
+        if not is_valid:
+            print(f"❌ Syntax check rejected fix for {job['fingerprint']}: {reason}")
+            jobs.finish(job["fingerprint"], "syntax_error")
+            rejected.add(job["fingerprint"])
+
+    by_file, by_branch = {}, {}
+    for job in ready:
+        if job["fingerprint"] in rejected:
+            continue
+        if job["stage"] == "linted":
+            by_branch.setdefault(job["artifacts"]["pull_request"]["branch_name"], []).append(job)
+        else:
+            by_file.setdefault(job["artifacts"]["context"]["filepath"], []).append(job)
+
+    for filepath, file_jobs in by_file.items():
+        # Every job was claimed up front; renew the lease so linting earlier files
+        # doesn't let another worker reclaim these and open a duplicate PR
+        held = jobs.touch(worker, [job["fingerprint"] for job in file_jobs])
+        file_jobs = [job for job in file_jobs if job["fingerprint"] in held]
+        if not file_jobs:
+            print(f"⚠️ Lease on {filepath} taken over by another worker — skipping.")
+            continue
+        print(f"📂 Building one PR for {len(file_jobs)} fix(es) in {filepath}")
+        try:
+            fixes = [
+                {
+                    "error_id": job["fingerprint"],
+                    "diagnosis_text": job["artifacts"]["diagnosis_text"],
+                    "final_code_str": job["artifacts"]["final_code_str"],
+                }
+                for job in file_jobs
+            ]
+            pull_request = build_pull_request(repo, filepath, fixes)
+        except Exception as e:
+            print(f"❌ Failed to build PR for {filepath}: {e}")
+            traceback.print_exc()
+            for job in file_jobs:
+                jobs.fail(job["fingerprint"], str(e))
             continue
 
-        print("🧪 Extracted replacement code:\n")
-        print(final_code_str)
+        accepted = set(pull_request["error_ids"]) if pull_request else set()
+        superseded = set(pull_request["superseded"]) if pull_request else set()
+        branch_jobs = []
+        for job in file_jobs:
+            if job["fingerprint"] in accepted:
+                job["artifacts"]["pull_request"] = pull_request
+                jobs.checkpoint(job["fingerprint"], "linted", job["artifacts"])
+                branch_jobs.append(job)
+            elif job["fingerprint"] in superseded:
+                jobs.finish(job["fingerprint"], "superseded")
+            else:
+                jobs.finish(job["fingerprint"], "lint_failed")
+        if branch_jobs:
+            by_branch[pull_request["branch_name"]] = branch_jobs
 
+    for branch_name, branch_jobs in by_branch.items():
+        held = jobs.touch(worker, [job["fingerprint"] for job in branch_jobs])
+        if len(held) < len(branch_jobs):
+            print(f"⚠️ Lease on {branch_name} taken over by another worker — skipping.")
+            continue
+        pull_request = branch_jobs[0]["artifacts"]["pull_request"]
         try:
-            print(f"📂 File path to be used in PR: {filepath}")
-            create_pull_request(filepath, line_number, diagnosis_text, final_code_str, error_id)
-            print(f"✅ Pull request created for error ID: {error_id}")
+            # A previous attempt may have opened the PR before crashing
+            if get_existing_pr(repo, pull_request["error_ids"][0]):
+                print(f"⚠️ PR already exists for {branch_name} — marking as opened.")
+            else:
+                submit_pull_request(repo, pull_request)
+                print(f"✅ Pull request created for error ID(s): {', '.join(pull_request['error_ids'])}")
         except Exception as e:
-            print(f"❌ Failed to create PR: {e}")
+            print(f"❌ Failed to create PR for {branch_name}: {e}")
             traceback.print_exc()
-    else:
-        print("\n⚠️ No error info in `custom.error`")
+            for job in branch_jobs:
+                jobs.fail(job["fingerprint"], str(e))
+            continue
+
+        for job in branch_jobs:
+            jobs.checkpoint(job["fingerprint"], "pr_opened", job["artifacts"])
+            jobs.finish(job["fingerprint"], "pr_opened")
+
+    return len(ready)
+
+def work(jobs: JobQueue, repo, worker: str) -> None:
+    """Drain the queue: diagnose every span, then submit the fixes grouped by file. Safe to run from several processes."""
+    while True:
+        job = jobs.claim(worker, ["fetched"])
+        if job is None:
+            break
+        try:
+            run_job(jobs, job, repo)
+        except Exception as e:
+            print(f"❌ Job {job['fingerprint']} failed at attempt {job['attempts']}: {e}")
+            traceback.print_exc()
+            jobs.fail(job["fingerprint"], str(e))
+        print("-" * 60)
+
+    submit_ready(jobs, repo, worker)
+
+def main():
+    repo = get_repo(GITHUB_TOKEN, REPO_NAME)
+    jobs = JobQueue()
+
+    # `--worker` only drains the queue, so extra processes can share the work of one fetch
+    if "--worker" not in sys.argv[1:]:
+        try:
+            spans = fetch_spans()
+        except RuntimeError as e:
+            print(e)
+            exit(1)
+
+        print(f"✅ Fetched {len(spans)} span(s).\n")
+
+        if TARGET_SPAN_ID:
+            filtered = [s for s in spans if s.get("attributes", {}).get("span_id") == TARGET_SPAN_ID]
+            if filtered:
+                print(f"🔍 Using span with ID: {TARGET_SPAN_ID}")
+                spans = filtered
+            else:
+                print(f"⚠️ No span matched TARGET_SPAN_ID={TARGET_SPAN_ID} — proceeding with all spans.")
+
+        queued = sum(enqueue_span(jobs, span) for span in spans)
+        print(f"📥 Queued {queued} new error(s); {len(spans) - queued} already queued or without error info.")
+
+    work(jobs, repo, worker=f"{os.uname().nodename}:{os.getpid()}")
+
 
-    print("-" * 60)
+if __name__ == "__main__":
+    main()
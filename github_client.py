@@ -1,6 +1,7 @@
-from github import Github
+from github import Github, InputGitTreeElement
 from github.GithubException import UnknownObjectException, GithubException
 import os
+import json
 
 def get_repo(token: str, repo_name: str):
     if not token:
@@ -24,24 +25,34 @@ def get_existing_pr(repo, fingerprint: str):
     return None
 
 def submit_pr_to_github(repo, filepath: str, branch_name: str, file_content: str, error_id: str, pr_body):
-    contents = repo.get_contents(filepath)
-    base_branch = repo.get_branch("main")
-    ref = f"refs/heads/{branch_name}"
+    submit_file_fix_pr(repo, filepath, branch_name, file_content, [error_id], pr_body)
 
-    try:
-        repo.get_git_ref(ref)
-        print(f"⚠️ Branch {branch_name} already exists. Using existing branch.")
-    except:
-        repo.create_git_ref(ref=ref, sha=base_branch.commit.sha)
-
-    repo.update_file(
-        path=filepath,
-        message=f"AI fix suggestion for {error_id}",
-        content=file_content,
-        sha=contents.sha,
-        branch=branch_name,
+def submit_file_fix_pr(repo, filepath: str, branch_name: str, file_content: str, error_ids: list[str], pr_body,
+                       base_sha: str = None):
+    # Git Data API: one tree + one commit, instead of get_contents + update_file per fix.
+    # base_sha is the commit file_content was built from; committing on top of it means
+    # newer changes on main conflict in the PR rather than being silently reverted.
+    if base_sha:
+        base_commit = repo.get_git_commit(base_sha)
+    else:
+        base_commit = repo.get_branch("main").commit.commit
+    tree = repo.create_git_tree(
+        [InputGitTreeElement(path=filepath, mode="100644", type="blob", content=file_content)],
+        base_tree=base_commit.tree,
+    )
+    commit = repo.create_git_commit(
+        message=f"AI fix suggestion for {', '.join(error_ids)}",
+        tree=tree,
+        parents=[base_commit],
     )
 
+    ref = f"refs/heads/{branch_name}"
+    try:
+        repo.get_git_ref(f"heads/{branch_name}").edit(sha=commit.sha, force=True)
+        print(f"⚠️ Branch {branch_name} already exists. Moved it to the new fix commit.")
+    except UnknownObjectException:
+        repo.create_git_ref(ref=ref, sha=commit.sha)
+
     # 🛠️ Safely handle pr_body before passing to .strip()
     if isinstance(pr_body, dict):
         pr_body = json.dumps(pr_body, indent=2)
@@ -50,8 +61,9 @@ def submit_pr_to_github(repo, filepath: str, branch_name: str, file_content: str
     else:
         pr_body = str(pr_body).strip()
 
+    # Every fingerprint goes in the title so get_existing_pr finds each of them
     pr = repo.create_pull(
-        title=f"[AI Fix] Patch for {error_id}",
+        title=f"[AI Fix] Patch for {', '.join(error_ids)}",
         body=f"This PR includes an AI-generated fix for `{filepath}`.\n\n{pr_body}",
         head=branch_name,
         base="main",
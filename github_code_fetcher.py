@@ -1,9 +1,10 @@
 from github import Github
 import os
 
-def fetch_code_context(filepath: str, line_number: int, context_lines: int = 10) -> str:
-    token = os.getenv("GITHUB_TOKEN")
-    repo = Github(token).get_repo("patchworkhealth/PatchworkOnRails")
+def fetch_code_context(filepath: str, line_number: int, context_lines: int = 10, repo=None) -> str:
+    if repo is None:
+        token = os.getenv("GITHUB_TOKEN")
+        repo = Github(token).get_repo("patchworkhealth/PatchworkOnRails")
 
     # Clean up the file path (e.g., remove `/app/` if needed)
     if filepath.startswith("/app/"):
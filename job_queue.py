@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "jobs.sqlite3")
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "1800"))  # a claimed job is reclaimable after this
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A finished or failed error that shows up again after this long is processed again from scratch
+RETRY_AFTER_SECONDS = int(os.getenv("JOB_RETRY_AFTER_SECONDS", "86400"))
+
+# Pipeline stages in order; a job's stage is the last one it completed
+STAGES = ["fetched", "diagnosed", "linted", "pr_opened"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    fingerprint TEXT PRIMARY KEY,
+    span TEXT NOT NULL,
+    stage TEXT NOT NULL DEFAULT 'fetched',
+    status TEXT NOT NULL DEFAULT 'pending',
+    outcome TEXT,
+    artifacts TEXT NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed_at REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, claimed_at);
+"""
+
+
+class JobQueue:
+    """
+    SQLite-backed span queue shared by every worker process on the host.
+    Each job records the last completed stage plus its artifacts, so a crashed
+    or timed-out run resumes where it stopped instead of redoing the LLM work.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_DB):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, fingerprint: str, span: dict) -> bool:
+        """
+        Queue a span. Jobs already in flight are left alone; jobs that finished or failed
+        more than RETRY_AFTER_SECONDS ago start over, so a recurring error whose PR was
+        closed or that hit a flaky run is picked up again (prepare_span skips open PRs).
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO jobs (fingerprint, span, created_at, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (fingerprint) DO UPDATE SET
+                    span = excluded.span, stage = 'fetched', status = 'pending', outcome = NULL,
+                    artifacts = '{}', attempts = 0, worker = NULL, claimed_at = NULL, error = NULL,
+                    created_at = excluded.created_at, updated_at = excluded.updated_at
+                WHERE jobs.status IN ('done', 'failed') AND jobs.updated_at < ?
+                """,
+                (fingerprint, json.dumps(span), now, now, now - RETRY_AFTER_SECONDS),
+            )
+            return cursor.rowcount == 1
+
+    def claim(self, worker: str, stages: list[str] = None):
+        jobs = self._claim(worker, stages or STAGES, limit=1)
+        return jobs[0] if jobs else None
+
+    def claim_all(self, worker: str, stages: list[str]) -> list[dict]:
+        """Claim every available job at the given stages, e.g. to group them by file."""
+        return self._claim(worker, stages, limit=-1)
+
+    def _claim(self, worker: str, stages: list[str], limit: int) -> list[dict]:
+        now = time.time()
+        placeholders = ", ".join("?" for _ in stages)
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same row
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A job whose worker died on every attempt would otherwise be reclaimed forever
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', error = 'lease expired on final attempt',
+                        worker = NULL, claimed_at = NULL, updated_at = ?
+                    WHERE status = 'claimed' AND claimed_at < ? AND attempts >= ?
+                    """,
+                    (now, now - LEASE_SECONDS, MAX_ATTEMPTS),
+                )
+                rows = conn.execute(
+                    f"""
+                    SELECT * FROM jobs
+                    WHERE stage IN ({placeholders})
+                        AND (status = 'pending' OR (status = 'claimed' AND claimed_at < ? AND attempts < ?))
+                    ORDER BY created_at LIMIT ?
+                    """,
+                    (*stages, now - LEASE_SECONDS, MAX_ATTEMPTS, limit),
+                ).fetchall()
+                conn.executemany(
+                    """
+                    UPDATE jobs SET status = 'claimed', worker = ?, claimed_at = ?,
+                        attempts = attempts + 1, updated_at = ?
+                    WHERE fingerprint = ?
+                    """,
+                    [(worker, now, now, row["fingerprint"]) for row in rows],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return [
+            {
+                "fingerprint": row["fingerprint"],
+                "span": json.loads(row["span"]),
+                "stage": row["stage"],
+                "artifacts": json.loads(row["artifacts"]),
+                "attempts": row["attempts"] + 1,
+            }
+            for row in rows
+        ]
+
+    def checkpoint(self, fingerprint: str, stage: str, artifacts: dict) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, artifacts = ?, claimed_at = ?, updated_at = ? WHERE fingerprint = ?",
+                (stage, json.dumps(artifacts), now, now, fingerprint),
+            )
+
+    def touch(self, worker: str, fingerprints: list[str]) -> set:
+        """
+        Renew the lease on jobs this worker still holds, before a long step on them.
+        Returns the fingerprints still held; any others were reclaimed by another worker.
+        """
+        now = time.time()
+        held = set()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for fingerprint in fingerprints:
+                cursor = conn.execute(
+                    """
+                    UPDATE jobs SET claimed_at = ?, updated_at = ?
+                    WHERE fingerprint = ? AND status = 'claimed' AND worker = ?
+                    """,
+                    (now, now, fingerprint, worker),
+                )
+                if cursor.rowcount == 1:
+                    held.add(fingerprint)
+            conn.execute("COMMIT")
+        return held
+
+    def release(self, fingerprint: str) -> None:
+        """Hand a job back to the queue so the next stage can pick it up."""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'pending', attempts = 0, worker = NULL, claimed_at = NULL, updated_at = ?
+                WHERE fingerprint = ?
+                """,
+                (time.time(), fingerprint),
+            )
+
+    def finish(self, fingerprint: str, outcome: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', outcome = ?, error = NULL, updated_at = ? WHERE fingerprint = ?",
+                (outcome, time.time(), fingerprint),
+            )
+
+    def fail(self, fingerprint: str, error: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    error = ?, worker = NULL, claimed_at = NULL, updated_at = ?
+                WHERE fingerprint = ?
+                """,
+                (MAX_ATTEMPTS, error, time.time(), fingerprint),
+            )
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, stage, COUNT(*) AS n FROM jobs GROUP BY status, stage").fetchall()
+        stats = {}
+        for row in rows:
+            stats.setdefault(row["status"], {})[row["stage"]] = row["n"]
+        return stats
@@ -0,0 +1,217 @@
+import os
+import json
+import re
+import threading
+import time
+import requests
+from openai import OpenAI
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "mistral")  # or "gpt-4"
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4-1106-preview")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+MODEL_ROUTER_CONFIG = os.getenv("MODEL_ROUTER_CONFIG")  # path to a JSON pool definition
+HEALTH_CHECK_INTERVAL = int(os.getenv("MODEL_HEALTH_CHECK_INTERVAL", "30"))
+FAILURE_THRESHOLD = int(os.getenv("MODEL_FAILURE_THRESHOLD", "3"))  # consecutive errors before a backend is benched
+
+SYSTEM_PROMPT = "You are a senior Ruby on Rails developer."
+
+
+class Backend:
+    def __init__(self, name: str, kind: str, model: str, host: str = None,
+                 max_in_flight: int = 1, timeout: int = 120):
+        self.name = name
+        self.kind = kind
+        self.model = model
+        self.host = host or OLLAMA_HOST
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.in_flight = 0
+        self.healthy = True
+        self.last_checked = 0.0
+        self.consecutive_failures = 0
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._client = None
+
+    def check_health(self, force: bool = False) -> bool:
+        if not force and time.time() - self.last_checked < HEALTH_CHECK_INTERVAL:
+            return self.healthy
+
+        if self.kind == "openai":
+            self.healthy = bool(OPENAI_API_KEY)
+        else:
+            try:
+                response = requests.get(f"{self.host}/api/tags", timeout=5)
+                self.healthy = response.status_code == 200
+            except requests.RequestException:
+                self.healthy = False
+
+        self.last_checked = time.time()
+        if self.healthy:
+            self.consecutive_failures = 0
+        else:
+            print(f"⚠️ Backend {self.name} failed health check.")
+        return self.healthy
+
+    def record_success(self):
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        # One transient error shouldn't bench a backend for a whole health-check interval
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= FAILURE_THRESHOLD:
+            self.healthy = False
+            self.last_checked = time.time()
+
+    def acquire(self, blocking: bool) -> bool:
+        acquired = self._slots.acquire(timeout=self.timeout) if blocking else self._slots.acquire(blocking=False)
+        if not acquired:
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def generate(self, prompt_text: str) -> str:
+        if self.kind == "openai":
+            print(f"🤖 Using {self.model} via OpenAI API ({self.name})")
+            if self._client is None:
+                self._client = OpenAI(api_key=OPENAI_API_KEY, timeout=self.timeout)
+            response = self._client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt_text},
+                ],
+                temperature=0.2,
+                max_tokens=1024,
+            )
+            return response.choices[0].message.content.strip()
+
+        print(f"🤖 Using {self.model} via Ollama at {self.host} ({self.name})")
+        response = requests.post(
+            f"{self.host}/api/generate",
+            json={
+                "model": self.model,
+                "prompt": prompt_text,
+                "stream": False,
+                "options": {"temperature": 0.2, "num_predict": 1024},
+            },
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama returned {response.status_code}: {response.text}")
+        return response.json()["response"].strip()
+
+
+class ModelRouter:
+    """
+    Routes prompts across a pool of backends.
+    Rules are checked in order; the first matching rule picks the candidate backends,
+    the rest of the pool is kept as fallback.
+    """
+
+    def __init__(self, backends: list[Backend], rules: list[dict] = None):
+        if not backends:
+            raise RuntimeError("❌ Model router needs at least one backend.")
+        self.backends = {b.name: b for b in backends}
+        self.rules = rules or []
+
+    def candidates(self, prompt_text: str, error_class: str = None) -> list[Backend]:
+        preferred = []
+        for rule in self.rules:
+            if rule_matches(rule, prompt_text, error_class):
+                preferred = [self.backends[name] for name in rule["backends"] if name in self.backends]
+                break
+
+        fallback = [b for b in self.backends.values() if b not in preferred]
+        # Least-loaded first within each tier so equal hosts share the work
+        preferred.sort(key=lambda b: b.in_flight / b.max_in_flight)
+        fallback.sort(key=lambda b: b.in_flight / b.max_in_flight)
+        return preferred + fallback
+
+    def ask(self, prompt_text: str, error_class: str = None) -> str:
+        candidates = self.candidates(prompt_text, error_class)
+        ordered = [b for b in candidates if b.check_health()]
+        if not ordered:
+            # Re-probe before giving up rather than trusting a cached failure
+            ordered = [b for b in candidates if b.check_health(force=True)]
+        if not ordered:
+            raise RuntimeError("❌ No healthy model backends available.")
+
+        errors = []
+        for i, backend in enumerate(ordered):
+            # Only wait for a slot on the last candidate; otherwise spill over to the next one
+            if not backend.acquire(blocking=i == len(ordered) - 1):
+                continue
+            try:
+                response = backend.generate(prompt_text)
+                backend.record_success()
+                return response
+            except Exception as e:
+                print(f"⚠️ Backend {backend.name} failed: {e} — falling back.")
+                backend.record_failure()
+                errors.append(f"{backend.name}: {e}")
+            finally:
+                backend.release()
+
+        raise RuntimeError(f"❌ All model backends failed: {'; '.join(errors) or 'no free slots'}")
+
+
+def rule_matches(rule: dict, prompt_text: str, error_class: str = None) -> bool:
+    if "error_class" in rule:
+        if not error_class or not re.fullmatch(rule["error_class"], error_class):
+            return False
+    if "max_prompt_chars" in rule and len(prompt_text) > rule["max_prompt_chars"]:
+        return False
+    if "min_prompt_chars" in rule and len(prompt_text) < rule["min_prompt_chars"]:
+        return False
+    return True
+
+
+def default_backend() -> Backend:
+    if MODEL_BACKEND == "gpt-4":
+        return Backend("gpt-4", "openai", OPENAI_MODEL)
+    return Backend(MODEL_BACKEND, "ollama", MODEL_BACKEND, host=OLLAMA_HOST)
+
+
+def load_router(config_path: str = None) -> ModelRouter:
+    config_path = config_path or MODEL_ROUTER_CONFIG
+    if not config_path:
+        return ModelRouter([default_backend()])
+
+    with open(config_path, "r") as f:
+        config = json.load(f)
+
+    backends = [
+        Backend(
+            name=b["name"],
+            kind=b.get("kind", "ollama"),
+            model=b["model"],
+            host=b.get("host"),
+            max_in_flight=b.get("max_in_flight", 1),
+            timeout=b.get("timeout", 120),
+        )
+        for b in config["backends"]
+    ]
+    return ModelRouter(backends, config.get("rules", []))
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = load_router()
+        return _router
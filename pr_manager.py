@@ -1,99 +1,189 @@
 import os
 import json
 import subprocess
+import tempfile
 import re
-from github_client import get_repo, get_existing_pr, submit_pr_to_github
+from github_client import get_repo, get_existing_pr, submit_file_fix_pr
 from ruby_linter import validate_with_rubocop, autocorrect_with_rubocop
 from ruby_parser import reindent_ruby_method, find_method_bounds
+from ruby_syntax import check_syntax_batch
 from dotenv import load_dotenv
 
 load_dotenv()
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 REPO_NAME = "patchworkhealth/PatchworkOnRails"
 
-def create_pull_request(filepath, line_number, diagnosis_text, final_code_str, error_id) -> None:
-    repo = get_repo(GITHUB_TOKEN, REPO_NAME)
+def create_pull_request(filepath, line_number, diagnosis_text, final_code_str, error_id, repo=None) -> None:
+    repo = repo or get_repo(GITHUB_TOKEN, REPO_NAME)
 
     if get_existing_pr(repo, error_id):
         print(f"🚫 Skipping PR creation — a matching PR already exists for error {error_id}.")
         return
 
-    contents = repo.get_contents(filepath)
-    lines = contents.decoded_content.decode().splitlines()
+    [(is_valid, reason)] = check_syntax_batch([final_code_str])
+    if not is_valid:
+        print(f"❌ Syntax check failed — skipping PR: {reason}")
+        return
+
+    fix = {"error_id": error_id, "diagnosis_text": diagnosis_text, "final_code_str": final_code_str}
+    pull_request = build_pull_request(repo, filepath, [fix])
+    if pull_request:
+        submit_pull_request(repo, pull_request)
 
+def prepare_method_fix(final_code_str: str):
+    """Autocorrect and validate one AI-generated method. Returns (method_name, lines), or None if rejected."""
     corrected_code = autocorrect_with_rubocop(final_code_str)
     if not corrected_code:
-        print("❌ RuboCop autocorrection failed — skipping PR.")
-        return
+        print("❌ RuboCop autocorrection failed — skipping fix.")
+        return None
 
-    corrected_lines = corrected_code.splitlines()
     method_name_match = re.search(r"def\s+(\w+)", corrected_code)
     method_name = method_name_match.group(1) if method_name_match else "unknown_method"
 
-
     is_valid, lint_output = validate_with_rubocop(corrected_code)
 
     if not is_valid:
         print(f"❌ RuboCop validation failed even after auto-correct:\n{lint_output}")
-        print("❌ Skipping PR — unsafe or unformatted Ruby code.")
-        return
+        print("❌ Skipping fix — unsafe or unformatted Ruby code.")
+        return None
 
-    final_code = reindent_ruby_method(corrected_lines)
-    final_code_str = "\n".join(final_code)
+    return method_name, reindent_ruby_method(corrected_code.splitlines())
 
+def apply_method_fix(lines: list[str], method_name: str, final_code: list[str]) -> list[str]:
     try:
         start, end = find_method_bounds(lines, method_name)
         print(f"🔧 Replacing method `{method_name}`: lines {start+1} to {end+1}")
-        lines = lines[:start] + final_code + lines[end + 1:]
+        return lines[:start] + final_code + lines[end + 1:]
     except ValueError:
         print(f"⚠️ Method '{method_name}' not found — appending it instead.")
-        lines.append("")
-        lines += final_code
+        return lines + [""] + final_code
+
+def lint_file(filepath: str, content: str):
+    """
+    Autocorrect and check a whole file in a scratch directory. Returns the linted content, or None.
+    The target repo's .rubocop.yml is not fetched, so RuboCop runs with its default config.
+    """
+    with tempfile.TemporaryDirectory(prefix="ai-fix-") as workdir:
+        # Keep the repo-relative path so offenses are reported against the file's real path
+        local_path = os.path.join(workdir, filepath)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "w") as f:
+            f.write(content)
 
-    updated_content = "\n".join(lines)
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, "w") as f:
-        f.write(updated_content)
-
-    try:
-        subprocess.run(["rubocop", "-A", filepath], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"❗ rubocop -A exited with error — continuing to validate:\n{e}")
-
-    final_validation = subprocess.run(
-        ["rubocop", filepath, "--format", "json"],
-        capture_output=True,
-        text=True
-    )
-
-    ignorable_offenses = {"Style/Documentation"}
-    if final_validation.returncode != 0:
         try:
-            result = json.loads(final_validation.stdout)
-            uncorrectable = [
-                o for f in result["files"] for o in f["offenses"]
-                if o["cop_name"] not in ignorable_offenses
-            ]
-            if uncorrectable:
-                print("❌ RuboCop found uncorrectable offenses:")
-                for o in uncorrectable:
-                    print(f"- {o['cop_name']}: {o['message']}")
-                print("❌ Skipping PR — file still has non-ignorable issues.")
-                return
-            else:
-                print("⚠️ RuboCop returned only ignorable offenses.")
-        except json.JSONDecodeError:
-            print("❌ Failed to parse RuboCop JSON output. Skipping PR.")
-            return
-
-    with open(filepath, "r") as f:
-        final_file_content = f.read()
-
-    branch_name = f"ai/fix-{error_id[:8]}"
-    explanation = diagnosis_text.split("```ruby")[0].strip()
-
-    pr_body = f"""
-### 🤖 AI Explanation
+            subprocess.run(["rubocop", "-A", filepath], cwd=workdir, check=True)
+        except subprocess.CalledProcessError as e:
+            print(f"❗ rubocop -A exited with error — continuing to validate:\n{e}")
+
+        final_validation = subprocess.run(
+            ["rubocop", filepath, "--format", "json"],
+            cwd=workdir,
+            capture_output=True,
+            text=True
+        )
+
+        ignorable_offenses = {"Style/Documentation"}
+        if final_validation.returncode != 0:
+            try:
+                result = json.loads(final_validation.stdout)
+                uncorrectable = [
+                    o for f in result["files"] for o in f["offenses"]
+                    if o["cop_name"] not in ignorable_offenses
+                ]
+                if uncorrectable:
+                    print("❌ RuboCop found uncorrectable offenses:")
+                    for o in uncorrectable:
+                        print(f"- {o['cop_name']}: {o['message']}")
+                    print("❌ Skipping PR — file still has non-ignorable issues.")
+                    return None
+                else:
+                    print("⚠️ RuboCop returned only ignorable offenses.")
+            except json.JSONDecodeError:
+                print("❌ Failed to parse RuboCop JSON output. Skipping PR.")
+                return None
+
+        with open(local_path, "r") as f:
+            return f.read()
+
+def build_pull_request(repo, filepath, fixes: list[dict]):
+    """
+    Apply every fix for one file in a single pass, lint the file once and build the PR.
+    Each fix is a dict with error_id, diagnosis_text and final_code_str.
+    Returns everything submit_pull_request needs, or None if nothing survived validation.
+    Fixes dropped because another fix to the same method made it in are listed under "superseded".
+    """
+    # Pin the main commit the fix is built on; it becomes the commit's parent, so later
+    # changes to the file on main show up as a conflict instead of being reverted
+    base_sha = repo.get_branch("main").commit.sha
+    contents = repo.get_contents(filepath, ref=base_sha)
+    original_lines = contents.decoded_content.decode().splitlines()
+
+    prepared = []
+    for fix in fixes:
+        result = prepare_method_fix(fix["final_code_str"])
+        if result is None:
+            print(f"⚠️ Dropping fix for {fix['error_id']} from {filepath}.")
+            continue
+        method_name, final_code = result
+        prepared.append(({**fix, "final_code_str": "\n".join(final_code)}, method_name, final_code))
+
+    if not prepared:
+        print(f"❌ No valid fixes left for {filepath} — skipping PR.")
+        return None
+
+    def apply_fixes(selected):
+        lines = original_lines
+        for _, method_name, final_code in selected:
+            lines = apply_method_fix(lines, method_name, final_code)
+        return "\n".join(lines)
+
+    # Two fixes for the same method would overwrite each other, so only one per method goes in
+    by_method = {}
+    for candidate in prepared:
+        by_method.setdefault(candidate[1], []).append(candidate)
+
+    applied = [candidates[0] for candidates in by_method.values()]
+    lint_rejected = []
+    final_file_content = lint_file(filepath, apply_fixes(applied))
+    if final_file_content is None and len(prepared) > 1:
+        # One bad fix shouldn't sink the rest: add methods one at a time, keeping the first
+        # fix for each that still lints
+        print(f"⚠️ Combined lint failed for {filepath} — retrying fixes one at a time.")
+        applied = []
+        for candidates in by_method.values():
+            for candidate in candidates:
+                content = lint_file(filepath, apply_fixes(applied + [candidate]))
+                if content is None:
+                    print(f"⚠️ Dropping fix for {candidate[0]['error_id']} from {filepath}.")
+                    lint_rejected.append(candidate)
+                    continue
+                applied.append(candidate)
+                final_file_content = content
+                break
+
+    if final_file_content is None:
+        return None
+
+    fixed_methods = {method_name for _, method_name, _ in applied}
+    superseded = [
+        candidate[0]["error_id"] for candidate in prepared
+        if candidate[1] in fixed_methods and candidate not in applied and candidate not in lint_rejected
+    ]
+    for error_id in superseded:
+        print(f"⚠️ Fix for {error_id} superseded by another fix to the same method in {filepath}.")
+
+    applied = [fix for fix, _, _ in applied]
+    error_ids = [fix["error_id"] for fix in applied]
+    branch_name = f"ai/fix-{error_ids[0][:8]}"
+    if len(error_ids) > 1:
+        branch_name += f"-and-{len(error_ids) - 1}-more"
+
+    sections = []
+    for fix in applied:
+        explanation = fix["diagnosis_text"].split("```ruby")[0].strip()
+        heading = f"## Error `{fix['error_id']}`\n\n" if len(applied) > 1 else ""
+        sections.append(f"""
+{heading}### 🤖 AI Explanation
 
 {explanation}
 
@@ -102,8 +192,27 @@ def create_pull_request(filepath, line_number, diagnosis_text, final_code_str, e
 ### ✅ Suggested Fix
 
 ```ruby
-{final_code_str}
+{fix['final_code_str']}
 ```
-""".strip()
-
-    submit_pr_to_github(repo, filepath, branch_name, final_file_content, error_id, pr_body)
+""".strip())
+
+    return {
+        "filepath": filepath,
+        "branch_name": branch_name,
+        "file_content": final_file_content,
+        "base_sha": base_sha,
+        "error_ids": error_ids,
+        "superseded": superseded,
+        "pr_body": "\n\n---\n\n".join(sections),
+    }
+
+def submit_pull_request(repo, pull_request: dict) -> None:
+    submit_file_fix_pr(
+        repo,
+        pull_request["filepath"],
+        pull_request["branch_name"],
+        pull_request["file_content"],
+        pull_request["error_ids"],
+        pull_request["pr_body"],
+        base_sha=pull_request.get("base_sha"),
+    )
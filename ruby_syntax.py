@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+SYNTAX_CHECK_WORKERS = int(os.getenv("SYNTAX_CHECK_WORKERS", str(os.cpu_count() or 1)))
+# Below this much code a process pool costs more to start than the tokenizer takes to run
+POOL_MIN_BYTES = int(os.getenv("SYNTAX_CHECK_POOL_MIN_BYTES", "500000"))
+
+# Compiles every snippet in one Ruby process — one launch per batch instead of three per candidate
+RUBY_BATCH_CHECK = """
+$VERBOSE = nil
+require "json"
+JSON.parse($stdin.read).each do |code|
+  begin
+    RubyVM::InstructionSequence.compile(code)
+    puts JSON.generate([true, ""])
+  rescue SyntaxError => e
+    puts JSON.generate([false, e.message.lines.first.to_s.strip])
+  end
+end
+"""
+
+BLOCK_OPENERS = {"def", "class", "module", "case", "begin", "for"}
+CONDITIONAL_OPENERS = {"if", "unless", "while", "until"}
+LOOP_KEYWORDS = {"while", "until", "for"}
+# A conditional keyword opens a block only at the start of an expression, otherwise it is a
+# modifier. `return if x` and `valid? or return if x` are modifiers, so return/and/or/not don't count.
+EXPRESSION_START = re.compile(r"(^|[=(,;|&:]|\b(?:then|do|else)\s*)\s*$")
+# A slash starts a regex literal after an operator or keyword, or as a bare argument (`split /,/`)
+REGEX_START = re.compile(
+    r"(^|[=(,;|&!~{\[:?]|\b(?:when|if|unless|elsif|while|until|return|and|or|not|then|else)\s*)\s*$"
+)
+REGEX_BODY = re.compile(r"(?:\\.|[^/\\])*/[imxo]*")
+TOKEN = re.compile(
+    r"""
+    (?P<comment>\#.*$)
+    | (?P<heredoc><<[~-]?(['"]?)(?P<heredoc_id>[A-Z_][A-Z0-9_]*)\3)
+    | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`)
+    | (?P<open_string>["'`])
+    | (?P<symbol>:[A-Za-z_]\w*[?!]?)
+    | (?P<word>[A-Za-z_]\w*[?!]?)
+    | (?P<bracket>[()\[\]{}])
+    | (?P<slash>/)
+    """,
+    re.VERBOSE,
+)
+PAIRS = {")": "(", "]": "[", "}": "{"}
+STRING_END = {quote: re.compile(rf"(?:\\.|[^{quote}\\])*{quote}") for quote in "\"'`"}
+
+
+def tokenize_check(code: str) -> tuple[bool, str]:
+    """
+    Pure-Python fallback when no Ruby is available: rejects unbalanced def/do/if ... end
+    blocks and brackets. Ambiguous constructs, such as a string still open at the end,
+    are let through — RuboCop still has the final say.
+    """
+    depth = 0
+    brackets = []
+    heredoc_end = None
+    open_quote = None
+
+    for number, line in enumerate(code.splitlines(), start=1):
+        if heredoc_end:
+            if line.strip() == heredoc_end:
+                heredoc_end = None
+            continue
+        if line.startswith("=begin"):
+            return True, ""  # embedded docs are rare enough to leave to Ruby
+
+        loop_on_line = False
+        pos = 0
+        if open_quote:
+            # Still inside a multi-line string: resume after its closing quote, if this line has it
+            closing = STRING_END[open_quote].match(line)
+            if closing is None:
+                continue
+            pos = closing.end()
+            open_quote = None
+        while True:
+            match = TOKEN.search(line, pos)
+            if match is None:
+                break
+            pos = match.end()
+            kind = match.lastgroup
+            if kind == "heredoc_id":
+                kind = "heredoc"
+            if kind == "comment":
+                break
+            if kind == "slash":
+                before = line[:match.start()]
+                bare_argument = before.endswith(" ") and not line[pos:pos + 1].isspace()
+                if REGEX_START.search(before) or (bare_argument and before.strip()):
+                    # Skip the literal so brackets and keywords inside it aren't counted;
+                    # with no closing slash on the line it was probably division after all
+                    literal = REGEX_BODY.match(line, pos)
+                    if literal:
+                        pos = literal.end()
+            elif kind == "heredoc":
+                heredoc_end = match.group("heredoc_id")
+            elif kind == "open_string":
+                open_quote = match.group()
+                break
+            elif kind == "bracket":
+                char = match.group()
+                if char in PAIRS:
+                    if not brackets or brackets.pop() != PAIRS[char]:
+                        return False, f"line {number}: unmatched '{char}'"
+                else:
+                    brackets.append(char)
+            elif kind == "word":
+                word = match.group()
+                preceded_by_dot = line[:match.start()].rstrip().endswith(".")
+                # `if: :active?` and `end: 2` are hash keys or keyword arguments, not keywords
+                hash_key = line[pos:pos + 1] == ":" and line[pos + 1:pos + 2] != ":"
+                if preceded_by_dot or hash_key:
+                    continue
+                if word in BLOCK_OPENERS:
+                    depth += 1
+                    loop_on_line = loop_on_line or word in LOOP_KEYWORDS
+                elif word in CONDITIONAL_OPENERS and EXPRESSION_START.search(line[:match.start()]):
+                    depth += 1
+                    loop_on_line = loop_on_line or word in LOOP_KEYWORDS
+                elif word == "do" and not loop_on_line:
+                    depth += 1
+                elif word == "end":
+                    depth -= 1
+                    if depth < 0:
+                        return False, f"line {number}: unexpected 'end'"
+
+    if open_quote:
+        return True, ""  # can't tell code from string contents past this point
+    if heredoc_end:
+        return False, f"unterminated heredoc {heredoc_end}"
+    if brackets:
+        return False, f"unclosed '{brackets[-1]}'"
+    if depth != 0:
+        return False, f"missing {depth} 'end'"
+    return True, ""
+
+
+def ruby_batch_check(candidates: list[str]) -> list[tuple[bool, str]]:
+    result = subprocess.run(
+        ["ruby", "-e", RUBY_BATCH_CHECK],
+        input=json.dumps(candidates),
+        capture_output=True,
+        text=True,
+        timeout=10,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    verdicts = [tuple(json.loads(line)) for line in result.stdout.splitlines()]
+    # A short answer would let the unchecked fixes through, so treat it as a failed check
+    if len(verdicts) != len(candidates):
+        raise RuntimeError(f"expected {len(candidates)} verdicts, got {len(verdicts)}")
+    return verdicts
+
+
+def check_syntax_batch(candidates: list[str]) -> list[tuple[bool, str]]:
+    """Syntax-check candidate fixes before they reach RuboCop. Returns (is_valid, reason) per candidate."""
+    if not candidates:
+        return []
+
+    if shutil.which("ruby"):
+        try:
+            return ruby_batch_check(candidates)
+        except (RuntimeError, subprocess.TimeoutExpired, json.JSONDecodeError) as e:
+            print(f"⚠️ Ruby syntax check failed ({e}) — falling back to tokenizer.")
+
+    if SYNTAX_CHECK_WORKERS < 2 or sum(len(code) for code in candidates) < POOL_MIN_BYTES:
+        return [tokenize_check(code) for code in candidates]
+    # spawn, not fork: this runs inside the service's worker thread next to HTTP and torch threads
+    with ProcessPoolExecutor(max_workers=min(SYNTAX_CHECK_WORKERS, len(candidates)),
+                             mp_context=get_context("spawn")) as pool:
+        return list(pool.map(tokenize_check, candidates, chunksize=8))
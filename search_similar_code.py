@@ -1,29 +1,57 @@
 import faiss
 import pickle
 import os
-from sentence_transformers import SentenceTransformer
+from embedding_cache import EmbeddingCache, encode_with_cache
+from embedding_encoder import load_encoder, encoder_cache_name
 
 INDEX_PATH = "codebase.index"
 METADATA_PATH = "codebase_metadata.pkl"
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+_model = None
+_cache = None
+_index = None
+_metadata = None
+_index_mtime = None
+
+
+def iter_metadata(path: str = METADATA_PATH):
+    """Yield metadata entries from the chunked pickle stream written by embed_codebase.py."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                return
+
 
 def load_index_and_metadata():
+    global _index, _metadata, _index_mtime
     if not os.path.exists(INDEX_PATH) or not os.path.exists(METADATA_PATH):
         raise FileNotFoundError("❌ Index or metadata file not found. Run embed_codebase.py first.")
 
-    index = faiss.read_index(INDEX_PATH)
-    with open(METADATA_PATH, "rb") as f:
-        metadata = pickle.load(f)
+    # Reuse the loaded index until embed_codebase.py writes a new one
+    mtime = max(os.path.getmtime(INDEX_PATH), os.path.getmtime(METADATA_PATH))
+    if _index is None or mtime != _index_mtime:
+        _index = faiss.read_index(INDEX_PATH)
+        _metadata = list(iter_metadata())
+        _index_mtime = mtime
+
+    return _index, _metadata
 
-    return index, metadata
+def get_model_and_cache():
+    global _model, _cache
+    if _model is None:
+        print("🔄 Loading embedding model...")
+        _model = load_encoder()
+        _cache = EmbeddingCache(_model.get_sentence_embedding_dimension())
+    return _model, _cache
 
 def search_similar_snippets(query: str, top_k: int = 5) -> list[str]:
-    print("🔄 Loading model and index...")
-    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    model, cache = get_model_and_cache()
     index, metadata = load_index_and_metadata()
 
     print("🔍 Embedding query...")
-    embedding = model.encode([query])
+    embedding = encode_with_cache(model, [query], cache, encoder_cache_name())
     print(f"🔎 Searching top {top_k} matches...")
     distances, indices = index.search(embedding, top_k)
 
@@ -0,0 +1,91 @@
+import os
+import json
+import threading
+import urllib.request
+import urllib.error
+from http.server import ThreadingHTTPServer
+import pytest
+
+pytest.importorskip("faiss")
+for name in ("DATADOG_API_KEY", "DATADOG_APP_KEY", "GITHUB_TOKEN"):
+    os.environ.setdefault(name, "test")
+
+import diagnoser_service
+from diagnoser_service import DiagnoserService, make_handler
+
+NOW_MS = 1_700_000_000_000
+
+
+def make_service(monkeypatch, pages):
+    service = object.__new__(DiagnoserService)
+    service.queued = []
+    service.submit = lambda span: service.queued.append(span["id"]) or True
+    service.calls = []
+
+    def fetch_span_page(from_time, to_time, limit, cursor=None):
+        service.calls.append((from_time, to_time, cursor))
+        return pages[cursor]
+
+    monkeypatch.setattr(diagnoser_service, "fetch_span_page", fetch_span_page)
+    monkeypatch.setattr(diagnoser_service.time, "time", lambda: NOW_MS / 1000)
+    return service
+
+
+PAGES = {
+    None: ([{"id": 1}, {"id": 2}], "c1"),
+    "c1": ([{"id": 3}], "c2"),
+    "c2": ([{"id": 4}], None),
+}
+
+
+def test_poll_follows_the_cursor_over_a_pinned_window(monkeypatch):
+    service = make_service(monkeypatch, PAGES)
+
+    window = service.poll_once("now-24h")
+
+    assert service.queued == [1, 2, 3, 4]
+    assert service.calls == [("now-24h", str(NOW_MS), None), ("now-24h", str(NOW_MS), "c1"),
+                             ("now-24h", str(NOW_MS), "c2")]
+    assert window == (str(NOW_MS - diagnoser_service.POLL_OVERLAP_MS), str(NOW_MS), None)
+
+
+def test_poll_resumes_from_the_cursor_after_max_pages(monkeypatch):
+    monkeypatch.setattr(diagnoser_service, "POLL_MAX_PAGES", 2)
+    service = make_service(monkeypatch, PAGES)
+
+    window = service.poll_once("now-24h")
+    assert service.queued == [1, 2, 3]
+    assert window == ("now-24h", str(NOW_MS), "c2")
+
+    # Later polls keep the pinned window until the cursor runs out
+    monkeypatch.setattr(diagnoser_service.time, "time", lambda: NOW_MS / 1000 + 300)
+    window = service.poll_once(*window)
+    assert service.queued == [1, 2, 3, 4]
+    assert service.calls[-1] == ("now-24h", str(NOW_MS), "c2")
+    assert window == (str(NOW_MS - diagnoser_service.POLL_OVERLAP_MS), str(NOW_MS), None)
+
+
+def post_spans(payload) -> tuple:
+    service = object.__new__(DiagnoserService)
+    service.submit = lambda span: True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_port}/spans", data=json.dumps(payload).encode(), method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_post_spans_accepts_spans_and_rejects_other_json():
+    assert post_spans({"data": [{"id": 1}, {"id": 2}]}) == (202, {"queued": 2})
+    assert post_spans({"id": 1}) == (202, {"queued": 1})
+    assert post_spans(123)[0] == 400
+    assert post_spans("span")[0] == 400
@@ -0,0 +1,102 @@
+import multiprocessing
+import numpy as np
+import embedding_cache
+from embedding_cache import EmbeddingCache, encode_with_cache, text_key
+
+
+def value_for(prefix, i):
+    return (100 if prefix == "a" else 200) + i
+
+
+def fill_cache(tmp_dir, prefix, count):
+    cache = EmbeddingCache(4, path=f"{tmp_dir}/cache.npy", index_path=f"{tmp_dir}/index.sqlite3", capacity=64)
+    for i in range(count):
+        cache.put(f"{prefix}-{i}", np.full(4, value_for(prefix, i), dtype=np.float32))
+
+
+def make_cache(tmp_path, capacity=8):
+    return EmbeddingCache(4, path=str(tmp_path / "cache.npy"), index_path=str(tmp_path / "index.sqlite3"),
+                          capacity=capacity)
+
+
+def test_concurrent_processes_never_share_a_slot(tmp_path):
+    make_cache(tmp_path, capacity=64)
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=fill_cache, args=(str(tmp_path), prefix, 20)) for prefix in ("a", "b")]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+        assert w.exitcode == 0
+
+    cache = make_cache(tmp_path, capacity=64)
+    assert len(cache) == 40
+    for prefix in ("a", "b"):
+        for i in range(20):
+            assert cache.get(f"{prefix}-{i}")[0] == value_for(prefix, i)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = make_cache(tmp_path, capacity=2)
+    cache.put("old", np.ones(4))
+    cache.put("kept", np.ones(4) * 2)
+    cache.get("old")
+    cache.save()
+    cache.put("new", np.ones(4) * 3)
+
+    assert cache.get("kept") is None
+    assert cache.get("old")[0] == 1
+    assert cache.get("new")[0] == 3
+
+
+def test_encode_with_cache_skips_model_for_cached_text(tmp_path):
+    class CountingModel:
+        calls = 0
+
+        def encode(self, texts, **kwargs):
+            self.calls += 1
+            return np.ones((len(texts), 4), dtype=np.float32)
+
+    cache = make_cache(tmp_path)
+    model = CountingModel()
+    encode_with_cache(model, ["NoMethodError  on nil"], cache, "m")
+    encode_with_cache(model, ["nomethoderror on nil"], cache, "m")
+
+    assert model.calls == 1
+    assert cache.get(text_key("NoMethodError on nil", "m")) is not None
+
+
+class PoolModel:
+    def __init__(self):
+        self.pool_starts = 0
+        self.pool_calls = []
+        self.local_calls = 0
+
+    def start_pool(self):
+        self.pool_starts += 1
+        return {"processes": [object()] * 4}
+
+    def encode(self, texts, **kwargs):
+        self.local_calls += 1
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+    def encode_multi_process(self, texts, pool, **kwargs):
+        self.pool_calls.append(kwargs)
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_pool_gets_whole_batches_and_is_only_started_when_needed(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "POOL_MIN_TEXTS", 10)
+    cache = make_cache(tmp_path, capacity=1024)
+    model = PoolModel()
+    texts = [f"def m{i}; end" for i in range(512)]
+
+    encode_with_cache(model, ["x = 1", "y = 2"], cache, "m", pool=model.start_pool, batch_size=64)
+    assert model.pool_starts == 0 and model.local_calls == 1
+
+    encode_with_cache(model, texts, cache, "m", pool=model.start_pool, batch_size=64)
+    assert model.pool_starts == 1
+    assert model.pool_calls == [{"batch_size": 64, "chunk_size": 128}]
+
+    encode_with_cache(model, texts, cache, "m", pool=model.start_pool, batch_size=64)
+    assert model.pool_starts == 1 and len(model.pool_calls) == 1
@@ -0,0 +1,77 @@
+import time
+import job_queue
+from job_queue import JobQueue
+
+
+def make_queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_duplicate_enqueue_is_ignored_while_in_flight(tmp_path):
+    jobs = make_queue(tmp_path)
+    assert jobs.enqueue("a", {"n": 1})
+    assert not jobs.enqueue("a", {"n": 1})
+    jobs.claim("w1")
+    assert not jobs.enqueue("a", {"n": 1})
+
+
+def test_resumed_job_keeps_stage_and_artifacts(tmp_path):
+    jobs = make_queue(tmp_path)
+    jobs.enqueue("a", {})
+    jobs.claim("w1")
+    jobs.checkpoint("a", "diagnosed", {"fix": "def a; end"})
+    jobs.fail("a", "rubocop crashed")
+
+    job = jobs.claim("w2")
+    assert job["stage"] == "diagnosed"
+    assert job["artifacts"] == {"fix": "def a; end"}
+
+
+def test_finished_job_is_requeued_after_retry_window(tmp_path, monkeypatch):
+    jobs = make_queue(tmp_path)
+    jobs.enqueue("a", {"n": 1})
+    jobs.claim("w1")
+    jobs.checkpoint("a", "diagnosed", {"fix": "x"})
+    jobs.finish("a", "lint_failed")
+
+    monkeypatch.setattr(job_queue, "RETRY_AFTER_SECONDS", 3600)
+    assert not jobs.enqueue("a", {"n": 2})
+
+    monkeypatch.setattr(job_queue, "RETRY_AFTER_SECONDS", 0)
+    time.sleep(0.01)
+    assert jobs.enqueue("a", {"n": 2})
+    job = jobs.claim("w1")
+    assert job["stage"] == "fetched"
+    assert job["span"] == {"n": 2}
+    assert job["artifacts"] == {}
+    assert job["attempts"] == 1
+
+
+def test_expired_lease_is_not_reclaimed_past_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", 0)
+    monkeypatch.setattr(job_queue, "MAX_ATTEMPTS", 2)
+    jobs = make_queue(tmp_path)
+    jobs.enqueue("a", {})
+
+    assert jobs.claim("w1")["attempts"] == 1
+    time.sleep(0.01)
+    assert jobs.claim("w2")["attempts"] == 2
+    time.sleep(0.01)
+    assert jobs.claim("w3") is None
+    assert jobs.stats() == {"failed": {"fetched": 1}}
+
+
+def test_touch_renews_the_lease_only_for_jobs_still_held(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", 60)
+    jobs = make_queue(tmp_path)
+    jobs.enqueue("a", {})
+    jobs.enqueue("b", {})
+    jobs.claim_all("w1", ["fetched"])
+
+    later = time.time() + 45
+    monkeypatch.setattr(job_queue.time, "time", lambda: later)
+    assert jobs.touch("w1", ["a"]) == {"a"}
+
+    later += 30  # a's renewed lease is still live, b's original one has expired
+    assert [job["fingerprint"] for job in jobs.claim_all("w2", ["fetched"])] == ["b"]
+    assert jobs.touch("w1", ["a", "b"]) == {"a"}
@@ -0,0 +1,105 @@
+import threading
+import model_router
+from model_router import Backend, ModelRouter
+
+
+class StubBackend(Backend):
+    def __init__(self, name, responses, **kwargs):
+        super().__init__(name, "ollama", name, host="http://stub", **kwargs)
+        self.responses = list(responses)
+        self.calls = 0
+
+    def check_health(self, force=False):
+        return self.healthy if not force else True
+
+    def generate(self, prompt_text):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_multi_backend_pool_answers_from_first_free_backend():
+    a = StubBackend("a", ["from a"])
+    b = StubBackend("b", ["from b"])
+    router = ModelRouter([a, b])
+
+    assert router.ask("prompt") == "from a"
+    assert a.in_flight == 0 and b.in_flight == 0
+
+
+def test_full_backend_spills_over_to_next_candidate():
+    a = StubBackend("a", ["from a"])
+    b = StubBackend("b", ["from b"])
+    router = ModelRouter([a, b], rules=[{"backends": ["a"]}])
+
+    assert a.acquire(blocking=False)
+    try:
+        assert router.ask("prompt") == "from b"
+    finally:
+        a.release()
+    assert a.calls == 0
+
+
+def test_failed_backend_falls_back():
+    a = StubBackend("a", [RuntimeError("boom")])
+    b = StubBackend("b", ["from b"])
+    router = ModelRouter([a, b], rules=[{"backends": ["a"]}])
+
+    assert router.ask("prompt") == "from b"
+    assert a.consecutive_failures == 1
+
+
+def test_single_transient_failure_does_not_bench_backend():
+    a = StubBackend("a", [RuntimeError("boom"), "recovered"])
+    router = ModelRouter([a])
+
+    try:
+        router.ask("prompt")
+    except RuntimeError:
+        pass
+    assert a.healthy
+    assert router.ask("prompt") == "recovered"
+    assert a.consecutive_failures == 0
+
+
+def test_backend_benched_after_repeated_failures(monkeypatch):
+    monkeypatch.setattr(model_router, "FAILURE_THRESHOLD", 2)
+    a = StubBackend("a", [RuntimeError("1"), RuntimeError("2")])
+    router = ModelRouter([a])
+
+    for _ in range(2):
+        try:
+            router.ask("prompt")
+        except RuntimeError:
+            pass
+    assert not a.healthy
+
+
+def test_max_in_flight_is_respected():
+    release = threading.Event()
+    peak = []
+
+    class SlowBackend(StubBackend):
+        def generate(self, prompt_text):
+            peak.append(self.in_flight)
+            release.wait(2)
+            return "ok"
+
+    backend = SlowBackend("slow", [], max_in_flight=2)
+    router = ModelRouter([backend])
+    threads = [threading.Thread(target=router.ask, args=("prompt",)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join()
+    assert max(peak) <= 2
+
+
+def test_rule_matches_error_class_and_prompt_size():
+    rule = {"error_class": "NoMethodError|NameError", "max_prompt_chars": 10}
+    assert model_router.rule_matches(rule, "short", "NoMethodError")
+    assert not model_router.rule_matches(rule, "short", "ArgumentError")
+    assert not model_router.rule_matches(rule, "x" * 11, "NameError")
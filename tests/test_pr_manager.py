@@ -0,0 +1,93 @@
+import pr_manager
+
+ORIGINAL = """class Shift
+  def a
+    1
+  end
+
+  def b
+    2
+  end
+end"""
+
+
+class FakeRepo:
+    def __init__(self):
+        self.content_refs = []
+
+    def get_branch(self, name):
+        return type("Branch", (), {"commit": type("Commit", (), {"sha": "base123"})()})()
+
+    def get_contents(self, path, ref=None):
+        self.content_refs.append(ref)
+        return type("Contents", (), {"decoded_content": ORIGINAL.encode()})()
+
+
+def fix(error_id, method, body):
+    return {"error_id": error_id, "diagnosis_text": "why", "final_code_str": f"def {method}\n  {body}\nend"}
+
+
+def stub_linting(monkeypatch, rejects):
+    monkeypatch.setattr(
+        pr_manager, "prepare_method_fix",
+        lambda code: (code.split()[1], code.splitlines()),
+    )
+    lint_calls = []
+
+    def lint_file(filepath, content):
+        lint_calls.append(content)
+        return None if any(bad in content for bad in rejects) else content
+
+    monkeypatch.setattr(pr_manager, "lint_file", lint_file)
+    return lint_calls
+
+
+def test_grouped_fixes_are_linted_once_and_pinned_to_base(monkeypatch):
+    lint_calls = stub_linting(monkeypatch, rejects=[])
+    repo = FakeRepo()
+
+    pull_request = pr_manager.build_pull_request(repo, "app/models/shift.rb", [fix("e1", "a", "10"), fix("e2", "b", "20")])
+
+    assert len(lint_calls) == 1
+    assert pull_request["error_ids"] == ["e1", "e2"]
+    assert pull_request["base_sha"] == "base123"
+    assert repo.content_refs == ["base123"]
+    assert "10" in pull_request["file_content"] and "20" in pull_request["file_content"]
+
+
+def test_one_bad_fix_does_not_reject_the_rest_of_the_file(monkeypatch):
+    stub_linting(monkeypatch, rejects=["BROKEN"])
+
+    pull_request = pr_manager.build_pull_request(
+        FakeRepo(), "app/models/shift.rb", [fix("e1", "a", "BROKEN"), fix("e2", "b", "20")]
+    )
+
+    assert pull_request["error_ids"] == ["e2"]
+    assert "BROKEN" not in pull_request["file_content"]
+    assert "20" in pull_request["file_content"]
+
+
+def test_fixes_to_the_same_method_keep_one_and_supersede_the_rest(monkeypatch):
+    lint_calls = stub_linting(monkeypatch, rejects=[])
+
+    pull_request = pr_manager.build_pull_request(
+        FakeRepo(), "app/models/shift.rb", [fix("e1", "a", "10"), fix("e2", "a", "20"), fix("e3", "b", "30")]
+    )
+
+    assert len(lint_calls) == 1
+    assert pull_request["error_ids"] == ["e1", "e3"]
+    assert pull_request["superseded"] == ["e2"]
+    assert "10" in pull_request["file_content"] and "20" not in pull_request["file_content"]
+    assert "`e2`" not in pull_request["pr_body"]
+
+
+def test_next_fix_for_a_method_is_tried_when_the_first_fails_lint(monkeypatch):
+    stub_linting(monkeypatch, rejects=["BROKEN"])
+
+    pull_request = pr_manager.build_pull_request(
+        FakeRepo(), "app/models/shift.rb", [fix("e1", "a", "BROKEN"), fix("e2", "a", "20")]
+    )
+
+    assert pull_request["error_ids"] == ["e2"]
+    assert pull_request["superseded"] == []
+    assert "20" in pull_request["file_content"]
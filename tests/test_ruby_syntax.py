@@ -0,0 +1,126 @@
+import subprocess
+import pytest
+import ruby_syntax
+from ruby_syntax import check_syntax_batch, tokenize_check
+
+VALID = {
+    "guard_clause": """
+def find_user(id)
+  user = User.find_by(id: id)
+  return if user.nil?
+  return unless user.active?
+  user
+end
+""",
+    "raise_unless": """
+def charge!(amount)
+  raise ArgumentError, "amount must be positive" unless amount.positive?
+  payment.capture(amount)
+end
+""",
+    "or_return_modifier": """
+def publish
+  valid? or return if strict?
+  update!(published: true)
+end
+""",
+    "blocks": """
+def summary(items)
+  label = if items.empty?
+    "none"
+  else
+    "some"
+  end
+  items.each do |item|
+    next unless item
+    puts item
+  end
+  while queue.any? do
+    queue.pop
+  end
+  label
+end
+""",
+    "regex_literals": """
+def parse(line)
+  return if line =~ /\\(/
+  parts = line.split /,/
+  parts.map { |part| part.gsub(/[)\\]]+/, "") }
+end
+""",
+    "division": """
+def ratio(a, b)
+  a / b + a/b
+end
+""",
+    "keyword_hash_keys": """
+class Shift < ApplicationRecord
+  validates :name, if: :active?
+  validates :ends_at, presence: true, unless: :draft?
+
+  def show
+    render(json: y, if: true)
+    Range.new(start: 1, end: 2)
+  end
+end
+""",
+    "multiline_string": """
+def notice
+  message = "Shift could not be saved:
+    please try again (or contact support"
+  flash[:alert] = 'it\\'s
+    broken'
+  message
+end
+""",
+}
+
+INVALID = {
+    "missing_end": "def foo\n  if bar\n    baz\nend\n",
+    "extra_end": "def foo\n  bar\nend\nend\n",
+    "unclosed_bracket": "def foo\n  bar(1, 2\nend\n",
+    "missing_end_after_string": "def foo\n  puts \"hi\n  there\"\n  if bar\n    baz\nend\n",
+}
+
+
+@pytest.mark.parametrize("name", sorted(VALID))
+def test_tokenizer_accepts_valid_ruby(name):
+    assert tokenize_check(VALID[name]) == (True, "")
+
+
+@pytest.mark.parametrize("name", sorted(INVALID))
+def test_tokenizer_rejects_broken_ruby(name):
+    is_valid, reason = tokenize_check(INVALID[name])
+    assert not is_valid
+    assert reason
+
+
+def test_small_batch_is_checked_in_process(monkeypatch):
+    monkeypatch.setattr(ruby_syntax.shutil, "which", lambda _: None)
+    monkeypatch.setattr(ruby_syntax, "SYNTAX_CHECK_WORKERS", 4)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("pool started for a small batch")
+
+    monkeypatch.setattr(ruby_syntax, "ProcessPoolExecutor", no_pool)
+    results = check_syntax_batch([VALID["guard_clause"], INVALID["missing_end"]])
+    assert [ok for ok, _ in results] == [True, False]
+
+
+@pytest.mark.skipif(ruby_syntax.shutil.which("ruby") is None, reason="ruby is not installed")
+def test_ruby_batch_check_returns_one_verdict_per_candidate():
+    candidates = [VALID["guard_clause"], INVALID["missing_end"], VALID["keyword_hash_keys"]]
+    results = ruby_syntax.ruby_batch_check(candidates)
+    assert [ok for ok, _ in results] == [True, False, True]
+    assert results[1][1]
+
+
+def test_short_ruby_output_falls_back_to_the_tokenizer(monkeypatch):
+    monkeypatch.setattr(ruby_syntax.shutil, "which", lambda _: "/usr/bin/ruby")
+
+    def short_run(*args, **kwargs):
+        return subprocess.CompletedProcess(args, 0, stdout='[true, ""]\n', stderr="")
+
+    monkeypatch.setattr(ruby_syntax.subprocess, "run", short_run)
+    results = check_syntax_batch([VALID["guard_clause"], INVALID["missing_end"]])
+    assert [ok for ok, _ in results] == [True, False]